@@ -1,19 +1,30 @@
 import sys
 import json
 import os
+import threading
 import serial
 import serial.tools.list_ports
 from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QRadioButton, QButtonGroup, \
-    QTextEdit, QLineEdit, QFileDialog, QGridLayout, QMessageBox
+    QTextEdit, QLineEdit, QFileDialog, QGridLayout, QMessageBox, QCheckBox, QProgressBar
 from PySide6.QtCore import QTimer, QDateTime
 from PySide6.QtGui import QIcon
 from PySide6.QtMultimedia import QSoundEffect  # 使用 QSoundEffect播放音效
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from session_capture import SessionRecorder
+import autodetect
+import protocols
+from bulk_send import BulkSender, parse_hex_text
 
 class SerialPortHelper(QWidget):
     def __init__(self):
         super().__init__()
         self.serial_port = serial.Serial()
+        self.session_recorder = None  # 会话录制器, 用于黄金回复比对
+        self.bulk_sender = None  # 文件发送任务
+        self.detect_executor = ThreadPoolExecutor(max_workers=1)  # 后台执行串口参数自动检测
+        self.detect_future = None
+        self.detect_cancel = threading.Event()  # 关闭窗口时通知自动检测提前结束
         self.initUI()
         self.apply_stylesheet()  # 调用样式表方法
         self.sound_effect = QSoundEffect()  # 初始化音效对象
@@ -58,29 +69,45 @@ class SerialPortHelper(QWidget):
         self.connect_button = QPushButton("连接")
         self.connect_button.setStyleSheet("background-color: red")  # 初始状态为未连接，红色
         self.connect_button.clicked.connect(self.toggle_connection)
+        self.autodetect_button = QPushButton("自动检测")
+        self.autodetect_button.clicked.connect(self.start_autodetect)
+        self.connect_layout = QHBoxLayout()
+        self.connect_layout.addWidget(self.connect_button)
+        self.connect_layout.addWidget(self.autodetect_button)
+        self.autodetect_all_check = QCheckBox("同时探测其他串口")
+        self.autodetect_all_check.setToolTip("探测指令会写入每个串口，确认没有接其他设备时再勾选")
+        self.connect_layout.addWidget(self.autodetect_all_check)
+        # 定时器用于查询自动检测结果
+        self.detect_timer = QTimer(self)
+        self.detect_timer.timeout.connect(self.check_autodetect)
 
         # 接收区
         self.receive_label = QLabel("接收 (UTF-8):")
         self.receive_layout = QHBoxLayout()
         self.receive_clear_button = QPushButton("清空接收区")
         self.receive_clear_button.clicked.connect(lambda: self.receive_text.clear())
+        self.record_button = QPushButton("录制会话")
+        self.record_button.clicked.connect(self.toggle_recording)
         self.receive_layout.addWidget(self.receive_label)
+        self.receive_layout.addWidget(self.record_button)
         self.receive_layout.addWidget(self.receive_clear_button)
         self.receive_text = QTextEdit()
+        self.receive_text.document().setMaximumBlockCount(5000)  # 只保留最近5000行，长时间运行时避免界面越来越卡
         # self.receive_text.setReadOnly(True) # 设置为只读
 
         # 协议选择区
         self.protocol_label = QLabel("协议选择:")
         self.protocol_layout = QHBoxLayout()
-        self.protocol1 = QRadioButton("TIRO_8bit")
-        self.protocol2 = QRadioButton("TIRO_16bit")
-        self.protocol2.setChecked(True)
-        self.protocol_layout.addWidget(self.protocol1)
-        self.protocol_layout.addWidget(self.protocol2)
+        self.protocol_group = QButtonGroup(self)
+        # 协议按钮由协议驱动注册表生成, 新增协议无需修改界面
+        for name in protocols.available_drivers():
+            button = QRadioButton(name)
+            button.setChecked(name == protocols.DEFAULT_DRIVER)
+            button.clicked.connect(lambda checked=False, n=name: self.protocol_select(n))
+            self.protocol_group.addButton(button)
+            self.protocol_layout.addWidget(button)
 
-        self.protocol_flag = 1  # 协议选择标志位, 0: 8bit, 1: 16bit
-        self.protocol1.clicked.connect(lambda: self.protocol_select(0))
-        self.protocol2.clicked.connect(lambda: self.protocol_select(1))
+        self.protocol_driver = protocols.get_driver(protocols.DEFAULT_DRIVER)  # 当前协议驱动
 
 
 
@@ -107,7 +134,7 @@ class SerialPortHelper(QWidget):
         self.volume_label = QLabel("音量调节(0-15):")
         self.volume_layout = QHBoxLayout()
         self.volume_text = QLineEdit()
-        self.volume_text.setPlaceholderText("请输入音量值(0-15)代表发送FFE0-FFEF")
+        self.volume_text.setPlaceholderText(f"请输入音量值(0-15)代表发送{self.protocol_driver.volume_range_text()}")
         self.volume_add_button = QPushButton("+1")
         self.volume_add_button.clicked.connect(self.send_volume_add)
         self.volume_minus_button = QPushButton("-1")
@@ -129,6 +156,38 @@ class SerialPortHelper(QWidget):
         self.hex_layout.addWidget(self.hex_text)
         self.hex_layout.addWidget(self.hex_button)
 
+        # 文件发送区
+        self.file_label = QLabel("发送文件:")
+        self.file_layout = QHBoxLayout()
+        self.file_hex_check = QCheckBox("按hex文本解析")
+        self.file_chunk_combo = QComboBox()
+        self.file_chunk_combo.addItems(["256", "1024", "4096", "16384"])
+        self.file_chunk_combo.setEditable(True)
+        self.file_chunk_combo.setCurrentIndex(1)  # 默认每块 1024 字节
+        self.file_chunk_combo.setToolTip("每次写入的字节数")
+        self.file_rate_text = QLineEdit()
+        self.file_rate_text.setPlaceholderText("限速(字节/秒), 空为不限")
+        self.file_button = QPushButton("选择文件发送")
+        self.file_button.clicked.connect(self.send_file)
+        self.file_layout.addWidget(self.file_hex_check)
+        self.file_layout.addWidget(self.file_chunk_combo)
+        self.file_layout.addWidget(self.file_rate_text)
+        self.file_layout.addWidget(self.file_button)
+        self.file_progress_layout = QHBoxLayout()
+        self.file_progress = QProgressBar()
+        self.file_progress.setRange(0, 1000)  # 按千分比显示, 避免超大文件超出进度条范围
+        self.file_progress.setFormat("%p%")
+        self.file_rate_label = QLabel("0.0 KB/s")
+        self.file_cancel_button = QPushButton("取消")
+        self.file_cancel_button.setEnabled(False)
+        self.file_cancel_button.clicked.connect(self.cancel_file_send)
+        self.file_progress_layout.addWidget(self.file_progress)
+        self.file_progress_layout.addWidget(self.file_rate_label)
+        self.file_progress_layout.addWidget(self.file_cancel_button)
+        # 定时器用于刷新文件发送进度
+        self.file_timer = QTimer(self)
+        self.file_timer.timeout.connect(self.check_file_send)
+
         # 连码播放区域
         self.play_save_layout = QHBoxLayout()
         self.play_label = QLabel("连码播放(需从头开始，中间不可留空，后面可以留空):")
@@ -248,7 +307,7 @@ class SerialPortHelper(QWidget):
         layout.addWidget(self.stopbits_label) # 停止位标签
         layout.addWidget(self.stopbits_combo) # 停止位选择
 
-        layout.addWidget(self.connect_button)  # 连接按钮
+        layout.addLayout(self.connect_layout)  # 连接按钮
 
         layout.addLayout(self.receive_layout) # 接收标签
         layout.addWidget(self.receive_text) # 接收文本框
@@ -259,6 +318,9 @@ class SerialPortHelper(QWidget):
         layout.addLayout(self.volume_layout)
         layout.addWidget(self.hex_label)
         layout.addLayout(self.hex_layout)
+        layout.addWidget(self.file_label)
+        layout.addLayout(self.file_layout)
+        layout.addLayout(self.file_progress_layout)
         layout.addLayout(self.play_save_layout)
         layout.addLayout(self.play_layout)
         layout.addLayout(self.play_label_layout)
@@ -411,6 +473,8 @@ class SerialPortHelper(QWidget):
             None
         """
         if self.serial_port.is_open:
+            # 先停止文件发送, 避免在发送线程写入时关闭串口
+            self.stop_file_send()
             self.serial_port.close()
             self.connect_button.setText("连接")
             self.connect_button.setStyleSheet("background-color: red")
@@ -427,6 +491,124 @@ class SerialPortHelper(QWidget):
             except Exception as e:
                 QMessageBox.warning(self, "错误", f"连接失败: {str(e)}")
 
+    def write_serial(self, data):
+        """
+        向串口写入数据，录制会话时同时记录发送内容。
+        :arg
+            data: 要发送的字节
+        :returns
+            none
+        :raises
+            serial.SerialException: 串口写入失败
+        """
+        self.serial_port.write(data)
+        if self.session_recorder is not None:
+            self.session_recorder.record_tx(data)
+
+    def toggle_recording(self):
+        """
+        开始或停止录制会话，录制的文件可用 golden_compare.py 与基线比对。
+        :arg
+            none
+        :returns
+            none
+        :raises
+            none
+        """
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+            self.receive_text.append(f"会话已保存: {self.session_recorder.path}")
+            self.session_recorder = None
+            self.record_button.setText("录制会话")
+            return
+        default_name = datetime.now().strftime("session_%Y%m%d_%H%M%S.jsonl")
+        path, _ = QFileDialog.getSaveFileName(self, "保存会话", default_name, "会话文件 (*.jsonl)")
+        if not path:
+            return
+        try:
+            # 接收数据由 status_timer 轮询读取, RX时间戳的分辨率即轮询间隔
+            self.session_recorder = SessionRecorder(path, self.status_timer.interval(), "gui")
+        except OSError as e:
+            QMessageBox.warning(self, "错误", f"无法创建会话文件: {str(e)}")
+            return
+        self.record_button.setText("停止录制")
+        self.receive_text.append(f"开始录制会话: {path}")
+
+    def start_autodetect(self):
+        """
+        后台探测串口的波特率、校验位和停止位，探测指令为重发音量输入框中的音量。
+        :arg
+            none
+        :returns
+            none
+        :raises
+            none
+        """
+        if self.serial_port.is_open:
+            QMessageBox.warning(self, "错误", "请先断开串口")
+            return
+        if self.detect_future is not None:
+            return
+        try:
+            volume_int = int(self.volume_text.text())
+            if volume_int < 0 or volume_int > 15:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "错误", "请先在音量调节中输入音量值(0-15)作为探测指令")
+            return
+        probe_frame = self.protocol_driver.encode_volume(volume_int)
+        # 默认只探测当前选择的串口, 勾选后其余串口同时探测, 分数相同时当前串口优先
+        ports = [self.port_combo.currentText()]
+        if self.autodetect_all_check.isChecked():
+            ports += [self.port_combo.itemText(i) for i in range(self.port_combo.count())
+                      if self.port_combo.itemText(i) != self.port_combo.currentText()]
+        preferred = []
+        try:
+            preferred.append((int(self.baudrate_combo.currentText()), self.parity_combo.currentText(),
+                              self.stopbits_combo.currentText()))
+        except ValueError:
+            pass
+        self.detect_future = self.detect_executor.submit(autodetect.detect, self.protocol_driver,
+                                                       probe_frame, ports, preferred, cancel=self.detect_cancel)
+        self.autodetect_button.setEnabled(False)
+        self.connect_button.setEnabled(False)
+        self.autodetect_button.setText("检测中...")
+        self.detect_timer.start(100)
+
+    def check_autodetect(self):
+        """
+        查询自动检测结果，检测成功则填入串口参数并连接。
+        :arg
+            none
+        :returns
+            none
+        :raises
+            none
+        """
+        if self.detect_future is None or not self.detect_future.done():
+            return
+        self.detect_timer.stop()
+        try:
+            result = self.detect_future.result()
+        except Exception as e:
+            result = None
+            print(f"自动检测失败: {e}")
+        self.detect_future = None
+        self.autodetect_button.setEnabled(True)
+        self.connect_button.setEnabled(True)
+        self.autodetect_button.setText("自动检测")
+        if result is None:
+            QMessageBox.warning(self, "错误", "未检测到可用的串口参数，请检查设备连接")
+            return
+        self.port_combo.setCurrentText(result["port"])
+        self.baudrate_combo.setCurrentText(str(result["baudrate"]))
+        self.parity_combo.setCurrentText(result["parity"])
+        self.stopbits_combo.setCurrentText(result["stopbits"])
+        source = "缓存" if result["cached"] else "探测"
+        self.receive_text.append(f"自动检测({source}): {result['port']} {result['baudrate']} "
+                                 f"校验位:{result['parity']} 停止位:{result['stopbits']}")
+        self.toggle_connection()
+
     def send_hex_add(self):
         """
         将发送文本框中的数字加1并更新文本框。
@@ -484,15 +666,11 @@ class SerialPortHelper(QWidget):
         if self.serial_port.is_open:
             hex_str = self.send_text.text()
             try:
-                # 发送前将输入的字符串转换为数字类型，然后转换为长度为4的hex文件，不够的前面补零
+                # 发送前将输入的字符串转换为数字类型，由协议驱动编码为1字节或2字节
                 hex_int = int(hex_str)
-                if self.protocol_flag == 0:
-                    hex_value = format(hex_int, '02x')
-                else:
-                    hex_value = format(hex_int, '04x')
-                hex_str = f"{hex_value}"
-                hex_data = bytes.fromhex(hex_str)
-                self.serial_port.write(hex_data)
+                hex_data = self.protocol_driver.encode_play(hex_int)
+                hex_str = hex_data.hex()
+                self.write_serial(hex_data)
                 # 格式化当前时间
                 now = datetime.now()
                 formatted_time = now.strftime("%H:%M:%S")
@@ -544,26 +722,16 @@ class SerialPortHelper(QWidget):
         """
         # 发送连码,从第一个开始到第一个空的输入框接收，每个输入框转为hex发送，每个前面都加上FFF3
         if self.serial_port.is_open:
-            hex_str = ""
+            numbers = []
             for i in range(1, 41):
                 if getattr(self, f"play_text{i}").text() == "":
                     break
-                play_str = getattr(self, f"play_text{i}").text()
-                try:
-                    if self.protocol_flag == 0:
-                        play_value = format(int(play_str), '02x') # 转为2位hex
-                    else:
-                        play_value = format(int(play_str), '04x') # 转为4位hex
-                except:
-                    QMessageBox.warning(self, "错误", "请输入有效的数字")
-                    return
-                if self.protocol_flag == 0:
-                    hex_str += f"F3{play_value}" # 8bit协议，前面加F3
-                else:
-                    hex_str += f"FFF3{play_value}" # 16bit协议，前面加FFF3
+                numbers.append(getattr(self, f"play_text{i}").text())
             try:
-                hex_data = bytes.fromhex(hex_str)
-                self.serial_port.write(hex_data)
+                # 由协议驱动编码, 8bit协议每个编号前加F3, 16bit协议前加FFF3
+                hex_data = self.protocol_driver.encode_sequence(int(number) for number in numbers)
+                hex_str = hex_data.hex().upper()
+                self.write_serial(hex_data)
                 # 格式化当前时间
                 now = datetime.now()
                 formatted_time = now.strftime("%H:%M:%S")
@@ -590,13 +758,10 @@ class SerialPortHelper(QWidget):
                 if volume_int < 0 or volume_int > 15:
                     QMessageBox.warning(self, "错误", "音量值必须在0-15之间")
                     return
-                # 发送音量值，根据协议选择发送不同的hex
-                if self.protocol_flag == 0:
-                    hex_str = f"E{volume_int:x}"
-                else:
-                    hex_str = f"FFE{volume_int:x}"
-                hex_data = bytes.fromhex(hex_str)
-                self.serial_port.write(hex_data)
+                # 发送音量值，由协议驱动编码
+                hex_data = self.protocol_driver.encode_volume(volume_int)
+                hex_str = hex_data.hex().upper()
+                self.write_serial(hex_data)
                 # 格式化当前时间
                 now = datetime.now()
                 formatted_time = now.strftime("%H:%M:%S")
@@ -667,8 +832,8 @@ class SerialPortHelper(QWidget):
         if self.serial_port.is_open:
             hex_str = self.hex_text.text()
             try:
-                hex_data = bytes.fromhex(hex_str)
-                self.serial_port.write(hex_data)
+                hex_data = parse_hex_text(hex_str)
+                self.write_serial(hex_data)
                 # 格式化当前时间
                 now = datetime.now()
                 formatted_time = now.strftime("%H:%M:%S")
@@ -678,9 +843,9 @@ class SerialPortHelper(QWidget):
         else:
             QMessageBox.warning(self, "错误", "请先连接串口")
 
-    def protocol_select(self, flag):
+    def send_file(self):
         """
-        选择协议，根据协议选择发送的hex长度
+        选择文件并在后台分块发送，可按hex文本解析后发送。
         :arg
             none
         :returns
@@ -688,12 +853,127 @@ class SerialPortHelper(QWidget):
         :raises
             none
         """
-        self.protocol_flag = flag
-        if flag == 0:
-            self.volume_text.setPlaceholderText("请输入音量值(0-15)代表发送E0-EF")
+        if not self.serial_port.is_open:
+            QMessageBox.warning(self, "错误", "请先连接串口")
+            return
+        if self.bulk_sender is not None:
+            QMessageBox.warning(self, "错误", "文件正在发送中")
+            return
+        try:
+            chunk_size = int(self.file_chunk_combo.currentText())
+            rate_limit = int(self.file_rate_text.text()) if self.file_rate_text.text() else 0
+            if chunk_size <= 0 or rate_limit < 0:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "错误", "请输入有效的分块大小和限速")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "选择要发送的文件")
+        if not path:
+            return
+        # hex文本在发送线程中解析, 录制会话时文件内容按块记录为TX
+        source = {"hex_path": path} if self.file_hex_check.isChecked() else {"path": path}
+        try:
+            self.bulk_sender = BulkSender(self.serial_port, chunk_size=chunk_size, rate_limit=rate_limit,
+                                          recorder=self.session_recorder, **source)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "错误", f"无法读取文件: {str(e)}")
+            return
+        self.bulk_path = path
+        self.bulk_sender.start()
+        self.file_progress.setValue(0)
+        self.set_send_enabled(False)
+        self.file_cancel_button.setEnabled(True)
+        self.file_timer.start(100)
+
+    def set_send_enabled(self, enabled):
+        """
+        启用或禁用所有发送按钮，文件发送期间禁用，避免其他指令插入文件数据中间。
+        :arg
+            enabled: 是否启用
+        :returns
+            none
+        :raises
+            none
+        """
+        for button in (self.send_button, self.send_add_button, self.send_minus_button, self.volume_button,
+                       self.volume_add_button, self.volume_minus_button, self.hex_button, self.play_send_button,
+                       self.autodetect_button, self.file_button):
+            button.setEnabled(enabled)
+
+    def stop_file_send(self):
+        """取消文件发送并等待发送线程结束"""
+        if self.bulk_sender is not None:
+            self.bulk_sender.cancel()
+            self.bulk_sender.join(2)
+            self.check_file_send()
+
+    def cancel_file_send(self):
+        """取消文件发送"""
+        if self.bulk_sender is not None:
+            self.bulk_sender.cancel()
+
+    def check_file_send(self):
+        """
+        刷新文件发送进度和速率，发送结束后输出结果。
+        :arg
+            none
+        :returns
+            none
+        :raises
+            none
+        """
+        sender = self.bulk_sender
+        if sender is None:
+            return
+        if sender.phase == "parsing":
+            self.file_progress.setFormat("解析 %p%")
+            if sender.parse_total:
+                self.file_progress.setValue(sender.parsed * 1000 // sender.parse_total)
         else:
-            self.volume_text.setPlaceholderText("请输入音量值(0-15)代表发送FFE0-FFEF")
-        self.receive_text.append(f"已选择协议: TIRO_{8*(flag+1)}bit")
+            self.file_progress.setFormat("%p%")
+            if sender.total:
+                self.file_progress.setValue(sender.sent * 1000 // sender.total)
+        self.file_rate_label.setText(f"{sender.rate / 1024:.1f} KB/s")
+        if not sender.done:
+            return
+        self.file_timer.stop()
+        self.bulk_sender = None
+        self.set_send_enabled(True)
+        self.file_progress.setFormat("%p%")
+        self.file_cancel_button.setEnabled(False)
+        formatted_time = datetime.now().strftime("%H:%M:%S")
+        summary = f"{sender.sent}/{sender.total} 字节, 用时 {sender.elapsed:.2f}s, 平均 {sender.rate / 1024:.1f} KB/s"
+        if sender.error is not None:
+            self.receive_text.append(f"{formatted_time} 文件发送失败:{self.bulk_path} {summary}")
+            QMessageBox.warning(self, "错误", f"文件发送失败: {str(sender.error)}")
+        elif sender.cancelled:
+            self.receive_text.append(f"{formatted_time} 文件发送已取消:{self.bulk_path} {summary}")
+        else:
+            self.file_progress.setValue(1000)
+            self.receive_text.append(f"{formatted_time} 已发送文件:{self.bulk_path} {summary}")
+
+    def protocol_select(self, name):
+        """
+        选择协议，从注册表中取出对应的协议驱动
+        :arg
+            name: 协议名
+        :returns
+            none
+        :raises
+            none
+        """
+        try:
+            # 插件驱动缺少编码方法或预编译失败时在这里报错, 保留原来的协议
+            driver = protocols.get_driver(name)
+            volume_range = driver.volume_range_text()
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"协议 {name} 不可用: {e}")
+            for button in self.protocol_group.buttons():
+                button.setChecked(button.text() == self.protocol_driver.name)
+            return
+        self.protocol_driver = driver
+        self.volume_text.setPlaceholderText(f"请输入音量值(0-15)代表发送{volume_range}")
+        self.receive_text.append(f"已选择协议: {name}")
 
     def read_serial_data(self):
         """读取串口数据并实时显示"""
@@ -702,7 +982,10 @@ class SerialPortHelper(QWidget):
                 # 检查串口是否有数据
                 if self.serial_port.in_waiting:
                     # 读取数据
-                    data = self.serial_port.read(self.serial_port.in_waiting).decode('utf-8', errors='ignore')
+                    raw = self.serial_port.read(self.serial_port.in_waiting)
+                    if self.session_recorder is not None:
+                        self.session_recorder.record_rx(raw)
+                    data = raw.decode('utf-8', errors='ignore')
                     # 格式化当前时间
                     now = datetime.now()
                     formatted_time = now.strftime("%H:%M:%S")
@@ -711,6 +994,17 @@ class SerialPortHelper(QWidget):
             except Exception as e:
                 print(f"读取串口数据失败: {e}")
 
+    def closeEvent(self, event):
+        """关闭窗口时停止文件发送和自动检测，并保存正在录制的会话"""
+        self.stop_file_send()
+        # 检测线程在探测完当前这组参数后结束, 不等待剩余的参数组合
+        self.detect_cancel.set()
+        self.detect_executor.shutdown(wait=False)
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+            self.session_recorder = None
+        super().closeEvent(event)
+
     # 在 SerialPort.py 文件中
     def apply_stylesheet(self):
         stylesheet = """
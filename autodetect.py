@@ -0,0 +1,226 @@
+"""
+串口参数自动检测。
+
+依次尝试候选的波特率、校验位、停止位组合，向设备发送一条无副作用的探测指令(如重发当前音量)，
+由协议驱动的 score_reply 给回复打分，分数可信时再探测一次确认两次回复解析结果一致，确认后即停止。
+检测结果按设备ID缓存到 autodetect_cache.json，已知设备重连时先验证缓存的参数，通常两次探测即可完成。
+默认只探测指定的串口；明确要求时才同时探测其他串口，并按分数选择结果。
+
+命令行用法:
+    python autodetect.py --protocol TIRO_16bit --volume 8 --port COM3
+    python autodetect.py --protocol TIRO_16bit --volume 8 --all-ports
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+import serial.tools.list_ports
+
+import protocols
+from session_capture import read_reply
+
+CACHE_FILE = "autodetect_cache.json"
+
+# 候选参数, 按常用程度排序, 越靠前越先尝试
+CANDIDATE_BAUDRATES = [1000000, 115200, 9600, 57600, 38400, 19200, 14400]
+CANDIDATE_PARITIES = ["None", "Even", "Odd"]
+CANDIDATE_STOPBITS = ["1", "2", "1.5"]
+
+PARITY_MAP = {"None": serial.PARITY_NONE, "Even": serial.PARITY_EVEN, "Odd": serial.PARITY_ODD}
+STOPBITS_MAP = {"1": serial.STOPBITS_ONE, "1.5": serial.STOPBITS_ONE_POINT_FIVE, "2": serial.STOPBITS_TWO}
+
+CONFIDENT_SCORE = 0.9  # 达到该分数即认为匹配成功
+
+_cache_lock = threading.Lock()
+
+
+def device_id(port_info):
+    """
+    生成设备ID，优先使用 VID:PID:序列号，拔插或更换USB口后仍能识别同一块板子。
+    :arg
+        port_info: serial.tools.list_ports 返回的 ListPortInfo
+    :returns
+        str: 设备ID
+    :raises
+        none
+    """
+    if port_info.vid is not None:
+        return f"{port_info.vid:04X}:{port_info.pid:04X}:{port_info.serial_number or port_info.device}"
+    if port_info.hwid and port_info.hwid != "n/a":
+        return port_info.hwid
+    return port_info.device
+
+
+def load_cache():
+    if os.path.exists(CACHE_FILE):
+        try:
+            with open(CACHE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+
+def save_cache(key, settings):
+    with _cache_lock:
+        cache = load_cache()
+        cache[key] = settings
+        with open(CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=4)
+
+
+def candidate_settings(preferred=None):
+    """
+    生成候选参数组合，preferred(缓存或界面当前的参数)排在最前面。
+    :arg
+        preferred: 可选的 (baudrate, parity, stopbits) 列表
+    :returns
+        生成器, 依次产出 (baudrate, parity, stopbits)
+    :raises
+        none
+    """
+    seen = set()
+    for settings in preferred or []:
+        if settings not in seen:
+            seen.add(settings)
+            yield settings
+    for baudrate in CANDIDATE_BAUDRATES:
+        for parity in CANDIDATE_PARITIES:
+            for stopbits in CANDIDATE_STOPBITS:
+                settings = (baudrate, parity, stopbits)
+                if settings not in seen:
+                    seen.add(settings)
+                    yield settings
+
+
+def probe(serial_port, driver, probe_frame, reply_timeout):
+    serial_port.reset_input_buffer()
+    sent_at = time.perf_counter()
+    serial_port.write(probe_frame)
+    reply, _ = read_reply(serial_port, sent_at, reply_timeout)
+    return driver.score_reply(reply), reply
+
+
+def confirm(serial_port, driver, probe_frame, reply_timeout, first_reply):
+    """再探测一次, 回复仍可信且解析结果与第一次一致才算确认; 参数不对时的乱码很难两次一致"""
+    score, reply = probe(serial_port, driver, probe_frame, reply_timeout)
+    return score >= CONFIDENT_SCORE and driver.parse_reply(reply) == driver.parse_reply(first_reply)
+
+
+def detect_port(port_info, driver, probe_frame, preferred=None, reply_timeout=0.2, cancel=None):
+    """
+    探测单个串口的参数。串口只打开一次，切换参数时直接修改已打开的串口。
+    :arg
+        port_info: ListPortInfo
+        driver: 协议驱动, 用于给回复打分和解析回复
+        probe_frame: 探测指令字节
+        preferred: 优先尝试的 (baudrate, parity, stopbits) 列表
+        reply_timeout: 每组参数等待回复的秒数
+        cancel: 可选的 threading.Event, 置位后提前结束
+    :returns
+        dict 或 None: {"port", "baudrate", "parity", "stopbits", "score", "cached"}, 无可信结果时为None
+    :raises
+        none
+    """
+    key = device_id(port_info)
+    cached = load_cache().get(key)
+    preferred = list(preferred or [])
+    if cached:
+        preferred.insert(0, (cached["baudrate"], cached["parity"], cached["stopbits"]))
+
+    try:
+        serial_port = serial.Serial(port_info.device, timeout=0, write_timeout=reply_timeout)
+    except (serial.SerialException, OSError):
+        return None
+
+    best = None
+    try:
+        for baudrate, parity, stopbits in candidate_settings(preferred):
+            if cancel is not None and cancel.is_set():
+                break
+            try:
+                serial_port.baudrate = baudrate
+                serial_port.parity = PARITY_MAP[parity]
+                serial_port.stopbits = STOPBITS_MAP[stopbits]
+                score, reply = probe(serial_port, driver, probe_frame, reply_timeout)
+                if score < CONFIDENT_SCORE or not confirm(serial_port, driver, probe_frame, reply_timeout, reply):
+                    continue
+            except Exception:
+                # 串口不支持该组参数(如部分USB转串口芯片不支持1.5停止位)
+                continue
+            best = {"port": port_info.device, "baudrate": baudrate, "parity": parity,
+                    "stopbits": stopbits, "score": score}
+            break
+    finally:
+        serial_port.close()
+
+    if best is None:
+        return None
+    best["cached"] = bool(cached) and (best["baudrate"], best["parity"], best["stopbits"]) == preferred[0]
+    save_cache(key, {"baudrate": best["baudrate"], "parity": best["parity"], "stopbits": best["stopbits"]})
+    return best
+
+
+def detect(driver, probe_frame, ports, preferred=None, reply_timeout=0.2, cancel=None):
+    """
+    探测指定的串口，多个串口时并发探测并等待全部完成，按分数选择结果，分数相同时 ports 中靠前的优先。
+    探测指令会写入每个被探测的串口，调用方应只传入确认接的是语音板的串口。
+    :arg
+        driver: 协议驱动
+        probe_frame: 探测指令字节
+        ports: 要探测的串口设备名列表, 越靠前优先级越高
+        preferred: 优先尝试的 (baudrate, parity, stopbits) 列表
+        reply_timeout: 每组参数等待回复的秒数
+        cancel: 可选的 threading.Event, 置位后所有串口都在当前这组参数探测完后结束
+    :returns
+        dict 或 None: 见 detect_port
+    :raises
+        none
+    """
+    by_device = {info.device: info for info in serial.tools.list_ports.comports()}
+    infos = [by_device[device] for device in ports if device in by_device]
+    if not infos:
+        return None
+
+    with ThreadPoolExecutor(max_workers=len(infos)) as executor:
+        futures = [executor.submit(detect_port, info, driver, probe_frame, preferred, reply_timeout, cancel)
+                   for info in infos]
+        results = [future.result() for future in futures]
+    best = None
+    for result in results:
+        if result is not None and (best is None or result["score"] > best["score"]):
+            best = result
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="自动检测串口的波特率、校验位和停止位")
+    parser.add_argument("--protocol", choices=list(protocols.available_drivers()), default=protocols.DEFAULT_DRIVER)
+    parser.add_argument("--volume", type=int, required=True, help="探测时发送的音量值(0-15), 建议填设备当前音量")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--port", action="append", help="要探测的串口, 可多次指定")
+    target.add_argument("--all-ports", action="store_true", help="探测全部串口(探测指令会写入每个串口)")
+    parser.add_argument("--reply-timeout", type=float, default=0.2, help="每组参数等待回复的秒数")
+    args = parser.parse_args(argv)
+
+    driver = protocols.get_driver(args.protocol)
+    try:
+        probe_frame = driver.encode_volume(args.volume)
+    except ValueError as e:
+        parser.error(str(e))
+    ports = args.port or [info.device for info in serial.tools.list_ports.comports()]
+    result = detect(driver, probe_frame, ports, reply_timeout=args.reply_timeout)
+    if result is None:
+        print("未检测到可用的串口参数", file=sys.stderr)
+        return 1
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+大文件分块发送。
+
+二进制文件通过 mmap 映射后按块切成 memoryview 发送，不会把整个文件读入内存或逐块复制；
+也可以把文本文件按hex文本解析后发送(支持空格、换行、逗号分隔和 0x 前缀)。
+hex文本在后台线程中按块流式解析为字节，解析完成后再发送，解析出错时不会发出任何数据。
+发送在后台线程中进行，界面通过 BulkSender 的属性查询进度、速率和结果，并可随时取消。
+"""
+import os
+import re
+import mmap
+import time
+import threading
+
+HEX_BLOCK_SIZE = 256 * 1024  # 流式解析hex文本时每次读取的字节数
+
+_HEX_SEPARATORS = re.compile(r"[\s,;]+")
+_HEX_SEPARATOR_CHARS = " \t\r\n\v\f,;"
+_HEX_PREFIX = re.compile(r"(?<![0-9A-Fa-f])0[xX]")
+_HEX_SINGLE_DIGIT = re.compile(r"(?<![0-9A-Fa-f])([0-9A-Fa-f])(?![0-9A-Fa-f])")
+_HEX_ODD_TOKEN = re.compile(r"(?<![0-9A-Fa-f])[0-9A-Fa-f]{3}(?:[0-9A-Fa-f]{2})*(?![0-9A-Fa-f])")
+
+
+def parse_hex_text(text):
+    """
+    解析hex文本，如 "FF F3 00 01"、"0xFF,0xF3,0x00,0x01"、"FFF30001"。
+    单个字符的字节(如 0x5)会自动在前面补0。整段文本用正则一次处理，不会为每个字节生成字符串。
+    :arg
+        text: hex文本
+    :returns
+        bytes: 解析后的字节
+    :raises
+        ValueError: 文本中含有非hex字符或奇数长度的hex串
+    """
+    text = _HEX_PREFIX.sub("", text)
+    if _HEX_ODD_TOKEN.search(text):
+        raise ValueError(f"hex串长度为奇数: {_HEX_ODD_TOKEN.search(text).group()}")
+    if _HEX_SINGLE_DIGIT.search(text):
+        text = _HEX_SINGLE_DIGIT.sub(r"0\1", text)
+    return bytes.fromhex(_HEX_SEPARATORS.sub("", text))
+
+
+_HEX_LEADING_RUN = re.compile(r"[0-9A-Fa-f]*")
+
+
+def _parse_hex_chunk(text, continuing):
+    """
+    解析流式读取的一段hex文本。continuing 为真时, 开头的hex字符是上一段中已解析的hex串的后续
+    (上一段已解析的部分为偶数长度), 这部分单独按偶数长度检查, 不会被当作单个字符的字节补0。
+    """
+    if not continuing:
+        return parse_hex_text(text)
+    run = _HEX_LEADING_RUN.match(text).group()
+    if len(run) % 2:
+        raise ValueError(f"hex串长度为奇数: ...{run}")
+    return bytes.fromhex(run) + parse_hex_text(text[len(run):])
+
+
+def _last_separator(text):
+    return max(text.rfind(ch) for ch in _HEX_SEPARATOR_CHARS)
+
+
+class BulkSender:
+    """
+    在后台线程中分块发送数据。
+    属性 phase/parsed/parse_total/sent/total/rate/error/done 可在其他线程中随时读取。
+    """
+
+    def __init__(self, serial_port, path=None, data=None, hex_path=None, chunk_size=1024, rate_limit=0,
+                 max_pending=4096, recorder=None):
+        """
+        :arg
+            serial_port: 已打开的串口
+            path: 要发送的二进制文件路径
+            data: 要发送的字节
+            hex_path: 要解析后发送的hex文本文件路径(path/data/hex_path 三选一)
+            chunk_size: 每次写入的字节数
+            rate_limit: 限速(字节/秒), 0 表示不限速
+            max_pending: 串口输出缓冲区中未发出的字节超过该值时暂停写入, 0 表示不检查
+            recorder: 可选的 SessionRecorder, 每块发送的数据记录为TX
+        :raises
+            ValueError: 参数无效
+            OSError: 文件不存在
+        """
+        if sum(source is not None for source in (path, data, hex_path)) != 1:
+            raise ValueError("path、data 和 hex_path 需要且只能指定一个")
+        if chunk_size <= 0:
+            raise ValueError("分块大小必须大于0")
+        self.serial_port = serial_port
+        self.path = path
+        self.data = data
+        self.hex_path = hex_path
+        self.chunk_size = chunk_size
+        self.rate_limit = rate_limit
+        self.max_pending = max_pending
+        self.recorder = recorder
+        self.phase = "parsing" if hex_path is not None else "sending"
+        self.parse_total = os.path.getsize(hex_path) if hex_path is not None else 0
+        self.parsed = 0
+        if path is not None:
+            self.total = os.path.getsize(path)
+        elif data is not None:
+            self.total = len(data)
+        else:
+            self.total = 0  # 解析完成后才知道
+        self.sent = 0
+        self.error = None
+        self.start_time = None
+        self.send_start = None
+        self.end_time = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self.start_time is not None and not self._thread.is_alive()
+
+    @property
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    @property
+    def rate(self):
+        """平均发送速率(字节/秒), 从开始发送时计算, 不含解析时间"""
+        if self.phase == "parsing" or self.send_start is None:
+            return 0.0
+        elapsed = (self.end_time or time.perf_counter()) - self.send_start
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def _parse_hex_file(self):
+        """
+        流式解析hex文本文件, 只保留解析结果, 返回 bytearray; 被取消时返回 None。
+        每块在最后一个分隔符处分开, 分隔符之后的部分留到下一块; 整块没有分隔符时(连续的hex串)
+        先解析偶数长度的部分, 余下的字符作为同一个hex串的后续, 结果与 parse_hex_text 解析整个文件一致。
+        """
+        data = bytearray()
+        carry = ""
+        continuing = False  # carry 开头是否为已解析了一部分的hex串的后续
+        with open(self.hex_path, "rb") as f:
+            while not self._cancel.is_set():
+                block = f.read(HEX_BLOCK_SIZE)
+                self.parsed += len(block)
+                if not block:
+                    data += _parse_hex_chunk(carry, continuing)
+                    return data
+                text = carry + block.decode("ascii")
+                cut = _last_separator(text)
+                if cut != -1:
+                    data += _parse_hex_chunk(text[:cut + 1], continuing)
+                    carry, continuing = text[cut + 1:], False
+                    continue
+                if not continuing and text[:2] in ("0x", "0X"):
+                    text = text[2:]
+                cut = len(text) - len(text) % 2
+                if cut:
+                    data += bytes.fromhex(text[:cut])
+                    continuing = True
+                carry = text[cut:]
+        return None
+
+    def _wait_for_room(self):
+        """按限速和串口输出缓冲区控制写入节奏"""
+        if self.rate_limit > 0:
+            delay = self.send_start + self.sent / self.rate_limit - time.perf_counter()
+            if delay > 0:
+                self._cancel.wait(delay)
+        if self.max_pending > 0:
+            try:
+                while self.serial_port.out_waiting > self.max_pending and not self._cancel.is_set():
+                    time.sleep(0.001)
+            except (AttributeError, NotImplementedError, OSError):
+                # 部分平台不支持查询输出缓冲区, 只按限速控制
+                self.max_pending = 0
+
+    def _send_view(self, view):
+        for offset in range(0, len(view), self.chunk_size):
+            if self._cancel.is_set():
+                break
+            self._wait_for_room()
+            if self._cancel.is_set():
+                break
+            with view[offset:offset + self.chunk_size] as chunk:
+                self.serial_port.write(chunk)
+                if self.recorder is not None:
+                    self.recorder.record_tx(chunk)
+                self.sent += len(chunk)
+
+    def _run(self):
+        self.send_start = time.perf_counter()
+        try:
+            if self.hex_path is not None:
+                self.data = self._parse_hex_file()
+                if self.data is None:
+                    return
+                self.total = len(self.data)
+                self.send_start = time.perf_counter()
+                self.phase = "sending"
+            if self.data is not None:
+                with memoryview(self.data) as view:
+                    self._send_view(view)
+            elif self.total > 0:
+                # 空文件不能映射, 直接视为发送完成
+                with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        self._send_view(view)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.end_time = time.perf_counter()
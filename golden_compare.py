@@ -0,0 +1,274 @@
+"""
+黄金回复回归比对。
+
+将候选会话(新固件)与基线会话(已验证固件)按指令对齐，逐条比较回复字节和回复延迟。
+两边都以流的方式读取，只保留固定大小的对齐窗口，可处理百万帧级别的会话。
+
+用法:
+    # 比较两个已录制的会话
+    python golden_compare.py baseline.jsonl candidate.jsonl --report report.json
+    # 对着基线现场回放并比较
+    python golden_compare.py baseline.jsonl --port COM3 --baudrate 1000000 --record candidate.jsonl
+
+存在差异时退出码为 1，便于在 CI 中使用。
+"""
+import sys
+import json
+import time
+import argparse
+from collections import deque
+
+import protocols
+from session_capture import Exchange, SessionRecorder, read_exchanges, read_reply, read_session_info
+
+LIVE_RESOLUTION_MS = 1.0  # 现场回放时 read_reply 按 1ms 轮询接收
+
+
+class _Window:
+    """对交互流的有限预读窗口"""
+
+    def __init__(self, exchanges, size):
+        self.iterator = iter(exchanges)
+        self.size = size
+        self.buffer = deque()
+        self.fill()
+
+    def fill(self):
+        while len(self.buffer) < self.size:
+            item = next(self.iterator, None)
+            if item is None:
+                break
+            self.buffer.append(item)
+
+    def pop(self):
+        item = self.buffer.popleft()
+        self.fill()
+        return item
+
+    def find(self, command):
+        for i, item in enumerate(self.buffer):
+            if item.command == command:
+                return i
+        return -1
+
+
+def _diff_record(kind, baseline, candidate, latency_tolerance, driver=None):
+    record = {"type": kind}
+    exchange = baseline or candidate
+    record["command"] = exchange.command.hex()
+    if driver is not None:
+        record["frames"] = [frame.hex() for frame in driver.split_frames(exchange.command)]
+    if baseline is not None:
+        record["baseline_index"] = baseline.index
+        record["baseline_reply"] = baseline.reply.hex()
+        if driver is not None:
+            record["baseline_text"] = driver.parse_reply(baseline.reply)
+    if candidate is not None:
+        record["candidate_index"] = candidate.index
+        record["candidate_reply"] = candidate.reply.hex()
+        if driver is not None:
+            record["candidate_text"] = driver.parse_reply(candidate.reply)
+    if baseline is not None and candidate is not None:
+        if baseline.latency is not None and candidate.latency is not None:
+            delta = candidate.latency - baseline.latency
+            record["latency_delta_ms"] = round(delta * 1000, 3)
+            if kind == "match" and latency_tolerance is not None and abs(delta) > latency_tolerance:
+                record["type"] = "latency"
+    return record
+
+
+def compare_exchanges(baseline, candidate, lookahead=32, latency_tolerance=None, driver=None):
+    """
+    按指令对齐两组交互并产出差异记录。
+    指令相同则比较回复; 不同时在预读窗口内寻找对方的指令以重新同步，
+    找不到的一侧记为 missing(基线有、候选无) 或 extra(候选有、基线无)。
+    :arg
+        baseline: 基线 Exchange 的可迭代对象
+        candidate: 候选 Exchange 的可迭代对象
+        lookahead: 重新同步时每侧最多预读的交互数
+        latency_tolerance: 回复延迟差的容忍度(秒), None 表示不检查延迟
+        driver: 可选的协议驱动, 指定时差异记录中附带按帧切分的指令和解析后的回复文本
+    :returns
+        生成器, 依次产出 dict, type 为 match / reply / latency / missing / extra
+    :raises
+        none
+    """
+    b = _Window(baseline, lookahead)
+    c = _Window(candidate, lookahead)
+    while b.buffer or c.buffer:
+        if not c.buffer:
+            yield _diff_record("missing", b.pop(), None, latency_tolerance, driver)
+        elif not b.buffer:
+            yield _diff_record("extra", None, c.pop(), latency_tolerance, driver)
+        elif b.buffer[0].command == c.buffer[0].command:
+            base, cand = b.pop(), c.pop()
+            kind = "match" if base.reply == cand.reply else "reply"
+            yield _diff_record(kind, base, cand, latency_tolerance, driver)
+        else:
+            in_candidate = c.find(b.buffer[0].command)
+            in_baseline = b.find(c.buffer[0].command)
+            if in_candidate != -1 and (in_baseline == -1 or in_candidate <= in_baseline):
+                for _ in range(in_candidate):
+                    yield _diff_record("extra", None, c.pop(), latency_tolerance, driver)
+            elif in_baseline != -1:
+                for _ in range(in_baseline):
+                    yield _diff_record("missing", b.pop(), None, latency_tolerance, driver)
+            else:
+                yield _diff_record("missing", b.pop(), None, latency_tolerance, driver)
+                yield _diff_record("extra", None, c.pop(), latency_tolerance, driver)
+
+
+class CompareSummary:
+    """流式汇总差异记录，只保留计数和延迟统计"""
+
+    def __init__(self, max_examples=20, resolution_ms=None, latency_checked=True):
+        self.resolution_ms = resolution_ms
+        self.latency_checked = latency_checked
+        self.counts = {"match": 0, "reply": 0, "latency": 0, "missing": 0, "extra": 0}
+        self.max_examples = max_examples
+        self.examples = []
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_min = None
+        self.latency_max = None
+
+    def add(self, record):
+        self.counts[record["type"]] += 1
+        if record["type"] != "match" and len(self.examples) < self.max_examples:
+            self.examples.append(record)
+        delta = record.get("latency_delta_ms")
+        if delta is not None:
+            self.latency_count += 1
+            self.latency_sum += delta
+            self.latency_min = delta if self.latency_min is None else min(self.latency_min, delta)
+            self.latency_max = delta if self.latency_max is None else max(self.latency_max, delta)
+
+    @property
+    def passed(self):
+        return all(count == 0 for kind, count in self.counts.items() if kind != "match")
+
+    def report(self):
+        return {
+            "passed": self.passed,
+            "counts": self.counts,
+            "latency_delta_ms": {
+                "count": self.latency_count,
+                "mean": round(self.latency_sum / self.latency_count, 3) if self.latency_count else None,
+                "min": self.latency_min,
+                "max": self.latency_max,
+                "resolution_ms": self.resolution_ms,
+                "checked": self.latency_checked,
+            },
+            "examples": self.examples,
+        }
+
+
+def live_exchanges(serial_port, commands, recorder=None, reply_timeout=0.5, idle_gap=0.05):
+    """
+    将指令逐条发送到串口并收集回复，现场生成候选交互。
+    :arg
+        serial_port: 已打开的 serial.Serial
+        commands: 要发送的指令字节的可迭代对象
+        recorder: 可选的 SessionRecorder, 用于同时保存候选会话
+        reply_timeout: 每条指令等待回复的最长时间(秒)
+        idle_gap: 判定回复结束的空闲间隔(秒)
+    :returns
+        生成器, 依次产出 Exchange
+    :raises
+        serial.SerialException: 串口读写失败
+    """
+    start = time.perf_counter()
+    for index, command in enumerate(commands):
+        serial_port.reset_input_buffer()
+        sent_at = time.perf_counter()
+        serial_port.write(command)
+        if recorder is not None:
+            recorder.record_tx(command)
+        reply, first_rx = read_reply(serial_port, sent_at, reply_timeout, idle_gap, recorder)
+        yield Exchange(index, command, reply, sent_at - start,
+                       None if first_rx is None else first_rx - sent_at)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按指令对齐比较两个串口会话的回复字节和延迟")
+    parser.add_argument("baseline", help="基线会话文件")
+    parser.add_argument("candidate", nargs="?", help="候选会话文件; 不指定时使用 --port 现场回放")
+    parser.add_argument("--port", help="现场回放使用的串口")
+    parser.add_argument("--baudrate", type=int, default=1000000)
+    parser.add_argument("--parity", choices=["None", "Even", "Odd"], default="None")
+    parser.add_argument("--stopbits", choices=["1", "1.5", "2"], default="1")
+    parser.add_argument("--record", help="现场回放时保存候选会话的路径")
+    parser.add_argument("--reply-timeout", type=float, default=0.5, help="每条指令等待回复的秒数")
+    parser.add_argument("--protocol", choices=list(protocols.available_drivers()),
+                        help="用该协议驱动切分指令帧并解析回复文本")
+    parser.add_argument("--lookahead", type=int, default=32, help="重新对齐时的预读窗口大小")
+    parser.add_argument("--latency-tolerance", type=float, help="回复延迟差容忍度(毫秒)")
+    parser.add_argument("--diff", help="逐条差异输出路径(JSON Lines), '-' 表示标准输出")
+    parser.add_argument("--report", help="汇总报告输出路径(JSON)")
+    args = parser.parse_args(argv)
+
+    if args.candidate is None and args.port is None:
+        parser.error("需要指定候选会话文件或 --port")
+
+    # 两边时间戳分辨率中较粗的一个决定了延迟差的可信程度
+    resolutions = [read_session_info(args.baseline).get("resolution_ms")]
+    if args.candidate is not None:
+        resolutions.append(read_session_info(args.candidate).get("resolution_ms"))
+    else:
+        resolutions.append(LIVE_RESOLUTION_MS)
+    known = [r for r in resolutions if r is not None]
+    resolution = max(known) if known else None
+    tolerance = None if args.latency_tolerance is None else args.latency_tolerance / 1000
+    latency_checked = tolerance is not None
+    if resolution is not None and resolution > LIVE_RESOLUTION_MS:
+        print(f"警告: 会话时间戳分辨率为 {resolution}ms, 延迟差主要是轮询误差", file=sys.stderr)
+        if tolerance is not None and args.latency_tolerance <= resolution:
+            print("警告: 延迟差容忍度不大于时间戳分辨率, 跳过延迟检查", file=sys.stderr)
+            tolerance = None
+            latency_checked = False
+    driver = protocols.get_driver(args.protocol) if args.protocol else None
+    serial_port = None
+    recorder = None
+    if args.candidate is not None:
+        candidate = read_exchanges(args.candidate)
+    else:
+        import serial
+        from autodetect import PARITY_MAP, STOPBITS_MAP  # 离线比对不需要 pyserial, 用到串口时才导入
+        serial_port = serial.Serial(args.port, args.baudrate, parity=PARITY_MAP[args.parity],
+                                    stopbits=STOPBITS_MAP[args.stopbits], timeout=0)
+        if args.record:
+            recorder = SessionRecorder(args.record, LIVE_RESOLUTION_MS, "live")
+        commands = (exchange.command for exchange in read_exchanges(args.baseline))
+        candidate = live_exchanges(serial_port, commands, recorder, args.reply_timeout)
+
+    summary = CompareSummary(resolution_ms=resolution, latency_checked=latency_checked)
+    diff_file = None
+    if args.diff == "-":
+        diff_file = sys.stdout
+    elif args.diff:
+        diff_file = open(args.diff, "w", encoding="utf-8")
+    try:
+        for record in compare_exchanges(read_exchanges(args.baseline), candidate, args.lookahead, tolerance, driver):
+            summary.add(record)
+            if diff_file is not None and record["type"] != "match":
+                diff_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if diff_file is not None and diff_file is not sys.stdout:
+            diff_file.close()
+        if recorder is not None:
+            recorder.close()
+        if serial_port is not None:
+            serial_port.close()
+
+    report = summary.report()
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+    counts = report["counts"]
+    print(f"一致:{counts['match']} 回复不同:{counts['reply']} 延迟超限:{counts['latency']} "
+          f"缺失:{counts['missing']} 多出:{counts['extra']}", file=sys.stderr)
+    return 0 if summary.passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+语音芯片协议驱动。
+
+每种协议实现为一个 ProtocolDriver 子类，负责编码播放/音量/连码指令、解析回复以及描述帧边界。
+内置 TIRO_8bit 和 TIRO_16bit 两种协议，其他协议可以通过 entry points 注册，例如在插件包的 pyproject.toml 中:
+    [project.entry-points."voicetool.protocols"]
+    MY_CHIP = "my_package.module:MyChipDriver"
+界面、命令行工具和参数探测都通过 get_driver() 从同一个注册表中选择驱动。
+驱动在实例化(即选择协议)时预先生成编码所需的结构和指令表，发送时不再按协议分支。
+"""
+import re
+import struct
+from abc import ABC, abstractmethod
+from importlib.metadata import entry_points
+
+ENTRY_POINT_GROUP = "voicetool.protocols"
+DEFAULT_DRIVER = "TIRO_16bit"
+
+# 波特率或校验位不对时, 帧错误常表现为连续的 0x00(break) 或 0xFF(空闲线)
+_FRAMING_GARBAGE = re.compile(rb"\x00\x00|\xff\xff")
+
+
+class ProtocolDriver(ABC):
+    """
+    协议驱动基类，子类需设置 name 和 frame_size 并实现三个编码方法，
+    缺少编码方法的驱动在实例化(get_driver)时即报错，不会等到第一次发送。
+    """
+
+    name = ""
+    frame_size = 1  # 每帧字节数, 发送的指令和连码都按该长度切分
+    min_reply_length = 4  # 有效回复的最少字节数, 太短的回复无法区分正常文本和乱码
+
+    def __init__(self):
+        self.compile()
+
+    def compile(self):
+        """选择协议时调用一次，预先生成编码器"""
+
+    @abstractmethod
+    def encode_play(self, number):
+        """
+        编码播放指令。
+        :arg
+            number: 语音编号(十进制)
+        :returns
+            bytes: 指令字节
+        :raises
+            ValueError: 编号超出协议范围
+        """
+
+    @abstractmethod
+    def encode_volume(self, volume):
+        """
+        编码音量指令。
+        :arg
+            volume: 音量值(0-15)
+        :returns
+            bytes: 指令字节
+        :raises
+            ValueError: 音量超出协议范围
+        """
+
+    @abstractmethod
+    def encode_sequence(self, numbers):
+        """
+        编码连码播放指令。
+        :arg
+            numbers: 语音编号的可迭代对象
+        :returns
+            bytes: 指令字节
+        :raises
+            ValueError: 编号超出协议范围
+        """
+
+    def parse_reply(self, data):
+        """
+        解析设备回复，默认按UTF-8文本逐行拆分。
+        :arg
+            data: 回复字节
+        :returns
+            list: 回复文本行
+        :raises
+            none
+        """
+        return [line for line in data.decode("utf-8", errors="replace").splitlines() if line.strip()]
+
+    def score_reply(self, data):
+        """
+        判断回复是否符合协议，用于串口参数自动检测。默认设备回复为UTF-8文本:
+        太短、含连续0x00/0xFF帧错误字节或解析不出文本行的回复记0分，
+        否则按合法字符(可打印且不是截断的多字节字符)所占比例打分。
+        :arg
+            data: 回复字节
+        :returns
+            float: 0~1 之间的分数
+        :raises
+            none
+        """
+        if len(data) < self.min_reply_length or _FRAMING_GARBAGE.search(data):
+            return 0.0
+        lines = self.parse_reply(data)
+        if not any(any(ch.isalnum() for ch in line) for line in lines):
+            return 0.0
+        text = data.decode("utf-8", errors="replace")
+        valid = sum(1 for ch in text if ch != "\ufffd" and (ch.isprintable() or ch in "\r\n\t"))
+        return valid / len(text)
+
+    def split_frames(self, data):
+        """
+        按帧边界切分指令字节，末尾不足一帧的部分单独作为最后一项。
+        :arg
+            data: 指令字节
+        :returns
+            list: 每帧的字节
+        :raises
+            none
+        """
+        size = self.frame_size
+        return [bytes(data[i:i + size]) for i in range(0, len(data), size)]
+
+    def volume_range_text(self):
+        """音量指令范围的提示文字, 如 FFE0-FFEF"""
+        return f"{self.encode_volume(0).hex().upper()}-{self.encode_volume(15).hex().upper()}"
+
+
+class TiroDriver(ProtocolDriver):
+    """
+    TIRO 协议: 播放指令为语音编号本身，音量为 E0-EF，连码每个编号前加 F3;
+    16bit 协议中每帧为两个字节, 音量为 FFE0-FFEF, 连码前缀为 FFF3。
+    """
+
+    value_format = ">B"
+
+    def compile(self):
+        self.value_struct = struct.Struct(self.value_format)
+        self.frame_size = self.value_struct.size
+        self.max_value = (1 << (8 * self.frame_size)) - 1
+        # 连码前缀和音量指令都是固定值, 提前生成
+        self.sequence_prefix = self.value_struct.pack(self.max_value - 0x0C)  # F3 / FFF3
+        volume_base = self.max_value - 0x1F  # E0 / FFE0
+        self.volume_frames = tuple(self.value_struct.pack(volume_base + v) for v in range(16))
+
+    def encode_play(self, number):
+        try:
+            return self.value_struct.pack(number)
+        except struct.error as e:
+            raise ValueError(f"语音编号超出范围(0-{self.max_value}): {number}") from e
+
+    def encode_volume(self, volume):
+        if volume < 0 or volume > 15:
+            raise ValueError(f"音量值必须在0-15之间: {volume}")
+        return self.volume_frames[volume]
+
+    def encode_sequence(self, numbers):
+        prefix = self.sequence_prefix
+        return b"".join(prefix + self.encode_play(number) for number in numbers)
+
+    def split_frames(self, data):
+        """
+        按 TIRO 指令切分: 连码前缀与其后的编号合为一帧，音量指令和播放指令各为一帧，
+        末尾不足一帧的部分单独作为最后一项。
+        """
+        size = self.frame_size
+        frames = []
+        i = 0
+        while i < len(data):
+            frame = bytes(data[i:i + size])
+            if frame == self.sequence_prefix and i + 2 * size <= len(data):
+                frame = bytes(data[i:i + 2 * size])
+            frames.append(frame)
+            i += len(frame)
+        return frames
+
+
+class Tiro8bitDriver(TiroDriver):
+    name = "TIRO_8bit"
+    value_format = ">B"
+
+
+class Tiro16bitDriver(TiroDriver):
+    name = "TIRO_16bit"
+    value_format = ">H"
+
+
+BUILTIN_DRIVERS = {
+    Tiro8bitDriver.name: Tiro8bitDriver,
+    Tiro16bitDriver.name: Tiro16bitDriver,
+}
+
+
+def _plugin_entry_points():
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return eps.select(group=ENTRY_POINT_GROUP)
+    return eps.get(ENTRY_POINT_GROUP, [])  # Python 3.8/3.9
+
+
+def available_drivers():
+    """
+    列出所有可用的协议驱动，内置驱动在前，同名时内置驱动优先。
+    :arg
+        none
+    :returns
+        dict: 协议名 -> 驱动类
+    :raises
+        none
+    """
+    drivers = dict(BUILTIN_DRIVERS)
+    for ep in _plugin_entry_points():
+        if ep.name in drivers:
+            continue
+        try:
+            drivers[ep.name] = ep.load()
+        except Exception as e:
+            print(f"加载协议驱动 {ep.name} 失败: {e}")
+    return drivers
+
+
+def get_driver(name=DEFAULT_DRIVER):
+    """
+    按名称选择协议驱动并实例化(此时预编译编码器)。
+    :arg
+        name: 协议名
+    :returns
+        ProtocolDriver: 驱动实例
+    :raises
+        KeyError: 没有该名称的协议
+        TypeError: 驱动没有实现全部编码方法
+    """
+    drivers = available_drivers()
+    if name not in drivers:
+        raise KeyError(f"未知协议: {name}, 可用协议: {', '.join(drivers)}")
+    return drivers[name]()
@@ -0,0 +1,196 @@
+"""
+串口会话录制与读取。
+
+会话文件为 JSON Lines 格式，每行记录一次收发事件，例如:
+    {"t": 0.012345, "dir": "TX", "hex": "fff301"}
+其中 t 为相对录制开始的秒数，dir 为 TX(发送) 或 RX(接收)，hex 为原始字节。
+文件第一行为 dir 为 META 的头信息，记录时间戳的分辨率(毫秒)，例如界面按 100ms 定时轮询接收，
+其RX时间戳最多晚 100ms，比较回复延迟时需要考虑。没有头信息的文件视为分辨率未知。
+读取时逐行解析，不会一次性把整个会话载入内存。
+"""
+import json
+import time
+import threading
+from collections import namedtuple
+
+# 一次"指令-回复"交互: 序号、发送的指令字节、回复字节、发送时间、首字节回复延迟(秒, 无回复为None)
+Exchange = namedtuple("Exchange", ["index", "command", "reply", "sent_at", "latency"])
+
+
+FLUSH_EVERY = 100  # 每记录多少条事件刷新一次文件, 程序崩溃时最多丢失这么多条
+
+
+class SessionRecorder:
+    """将串口收发的原始字节按时间顺序写入会话文件"""
+
+    def __init__(self, path, resolution_ms=1.0, source=""):
+        """
+        :arg
+            path: 会话文件路径
+            resolution_ms: RX时间戳的分辨率(毫秒), 如接收轮询间隔
+            source: 录制来源, 如 "gui" 或 "live"
+        :raises
+            OSError: 无法创建文件
+        """
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+        self.start = time.perf_counter()
+        self.pending = 0
+        self.lock = threading.Lock()  # 文件发送线程和界面线程会同时记录
+        header = {"t": 0.0, "dir": "META", "resolution_ms": resolution_ms, "source": source}
+        self.file.write(json.dumps(header) + "\n")
+        self.file.flush()
+
+    def record(self, direction, data):
+        """
+        记录一次收发事件。
+        :arg
+            direction: "TX" 或 "RX"
+            data: 收发的原始字节
+        :returns
+            none
+        :raises
+            none
+        """
+        if not data:
+            return
+        with self.lock:
+            if self.file.closed:
+                return
+            event = {"t": round(time.perf_counter() - self.start, 6), "dir": direction, "hex": bytes(data).hex()}
+            self.file.write(json.dumps(event) + "\n")
+            self.pending += 1
+            if self.pending >= FLUSH_EVERY:
+                self.file.flush()
+                self.pending = 0
+
+    def record_tx(self, data):
+        self.record("TX", data)
+
+    def record_rx(self, data):
+        self.record("RX", data)
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+def read_reply(serial_port, sent_at, reply_timeout=0.5, idle_gap=0.05, recorder=None):
+    """
+    收集一条指令的回复，回复开始后若 idle_gap 秒内无新数据则视为回复结束。
+    :arg
+        serial_port: 已打开的串口(timeout=0)
+        sent_at: 指令发送时刻(time.perf_counter)
+        reply_timeout: 等待回复的最长时间(秒)
+        idle_gap: 判定回复结束的空闲间隔(秒)
+        recorder: 可选的 SessionRecorder, 收到的数据同时记录为RX
+    :returns
+        (回复字节, 首字节到达时刻), 无回复时首字节到达时刻为None
+    :raises
+        serial.SerialException: 串口读取失败
+    """
+    reply = bytearray()
+    first_rx = None
+    last_rx = sent_at
+    while True:
+        now = time.perf_counter()
+        if now - sent_at > reply_timeout or (first_rx is not None and now - last_rx > idle_gap):
+            break
+        waiting = serial_port.in_waiting
+        if waiting:
+            data = serial_port.read(waiting)
+            last_rx = time.perf_counter()
+            if first_rx is None:
+                first_rx = last_rx
+            reply += data
+            if recorder is not None:
+                recorder.record_rx(data)
+        else:
+            time.sleep(0.001)
+    return bytes(reply), first_rx
+
+
+def read_session_info(path):
+    """
+    读取会话文件的头信息。
+    :arg
+        path: 会话文件路径
+    :returns
+        dict: 头信息, 没有头信息时为空字典
+    :raises
+        OSError: 文件无法读取
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                return {}
+            return event if event.get("dir") == "META" else {}
+    return {}
+
+
+def read_events(path):
+    """
+    逐行读取会话文件。
+    :arg
+        path: 会话文件路径
+    :returns
+        生成器, 依次产出 (t, dir, bytes)
+    :raises
+        ValueError: 文件中存在无法解析的行
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+                if event["dir"] == "META":
+                    continue
+                yield float(event["t"]), event["dir"], bytes.fromhex(event["hex"])
+            except (ValueError, KeyError) as e:
+                raise ValueError(f"{path} 第{line_no}行格式错误: {e}") from e
+
+
+def iter_exchanges(events):
+    """
+    将收发事件按指令分组: 每条TX与其后、下一条TX之前的所有RX组成一次交互。
+    第一条TX之前收到的数据会被丢弃。
+    :arg
+        events: (t, dir, bytes) 的可迭代对象
+    :returns
+        生成器, 依次产出 Exchange
+    :raises
+        none
+    """
+    index = 0
+    command = None
+    sent_at = 0.0
+    first_rx = None
+    reply = bytearray()
+    for t, direction, data in events:
+        if direction == "TX":
+            if command is not None:
+                yield Exchange(index, command, bytes(reply), sent_at, None if first_rx is None else first_rx - sent_at)
+                index += 1
+            command = data
+            sent_at = t
+            first_rx = None
+            reply = bytearray()
+        elif command is not None:
+            if first_rx is None:
+                first_rx = t
+            reply += data
+    if command is not None:
+        yield Exchange(index, command, bytes(reply), sent_at, None if first_rx is None else first_rx - sent_at)
+
+
+def read_exchanges(path):
+    """读取会话文件并按指令分组，见 iter_exchanges"""
+    return iter_exchanges(read_events(path))
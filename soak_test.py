@@ -0,0 +1,395 @@
+"""
+长时间浸泡测试(无界面)。
+
+按目标速率向设备持续发送随机或脚本指定的播放/音量/连码指令，记录每条指令的回复延迟，
+并定期采样进程内存(RSS)、tracemalloc 分配最多的代码位置、收发速率和延迟分位数，
+写入滚动的指标文件(JSON Lines)。与第一次采样相比内存增长或延迟变差超过阈值时给出告警。
+每条指令都要等回复结束(或超时)才发下一条，设备回复慢时实际速率会低于 --rate，此时也会告警。
+模拟设备运行在单独的子进程中，不会计入被测进程的内存指标。
+
+用法:
+    # 对着真实设备运行 8 小时
+    python soak_test.py --port COM3 --baudrate 1000000 --duration 28800
+    # 在 Linux/macOS 上对着 pty 模拟设备运行
+    python soak_test.py --simulate --duration 600 --interval 10
+
+脚本文件每行一条指令: "play 5"、"volume 8" 或 "sequence 1 2 3"，# 开头为注释，按顺序循环发送。
+"""
+import os
+import sys
+import json
+import time
+import random
+import select
+import argparse
+import subprocess
+import tracemalloc
+import logging
+from logging.handlers import RotatingFileHandler
+
+import serial
+
+import protocols
+from autodetect import PARITY_MAP, STOPBITS_MAP
+from session_capture import read_reply
+
+try:
+    import psutil  # 可选依赖, 用于跨平台读取 RSS
+except ImportError:
+    psutil = None
+
+
+def current_rss():
+    """
+    读取当前进程的常驻内存(字节)。
+    :arg
+        none
+    :returns
+        int 或 None: 无法读取时为 None
+    :raises
+        none
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
+
+
+def serve_simulator(reply_delay=0.002):
+    """
+    在当前进程中运行基于 pty 的模拟语音板(仅 Linux/macOS)，由 SimulatedDevice 在子进程中调用。
+    先在标准输出打印串口路径，之后每收到一批指令回复一行 "OK <hex>"，标准输入关闭(父进程退出)时结束。
+    """
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    print(os.ttyname(slave), flush=True)
+    while True:
+        readable, _, _ = select.select([master, sys.stdin], [], [])
+        if sys.stdin in readable and not sys.stdin.buffer.read1(4096):
+            return
+        if master in readable:
+            try:
+                data = os.read(master, 4096)
+            except OSError:
+                return
+            time.sleep(reply_delay)
+            os.write(master, b"OK " + data.hex().upper().encode() + b"\r\n")
+
+
+class SimulatedDevice:
+    """在子进程中运行模拟语音板, 其内存分配不会混入被测进程的 RSS 和 tracemalloc 统计"""
+
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve-simulator"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.port = self.process.stdout.readline().strip()
+        if not self.port:
+            self.close()
+            raise OSError("模拟设备启动失败")
+
+    def close(self):
+        self.process.stdin.close()
+        try:
+            self.process.wait(2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class CommandSource:
+    """生成要发送的指令: 有脚本时按脚本循环, 否则随机生成"""
+
+    def __init__(self, driver, script=None, max_play=100, seed=None):
+        self.driver = driver
+        self.max_play = max_play
+        self.random = random.Random(seed)
+        self.script = self.load_script(script) if script else None
+        self.position = 0
+
+    def load_script(self, path):
+        commands = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                try:
+                    commands.append(self.encode(line.split()))
+                except (ValueError, IndexError) as e:
+                    raise ValueError(f"{path} 第{line_no}行指令无效: {line}") from e
+        if not commands:
+            raise ValueError(f"{path} 中没有指令")
+        return commands
+
+    def encode(self, words):
+        kind, values = words[0], [int(v) for v in words[1:]]
+        if kind == "play":
+            return self.driver.encode_play(values[0])
+        if kind == "volume":
+            return self.driver.encode_volume(values[0])
+        if kind == "sequence":
+            return self.driver.encode_sequence(values)
+        raise ValueError(f"未知指令: {kind}")
+
+    def next(self):
+        if self.script is not None:
+            command = self.script[self.position]
+            self.position = (self.position + 1) % len(self.script)
+            return command
+        kind = self.random.choice(("play", "volume", "sequence"))
+        if kind == "play":
+            return self.driver.encode_play(self.random.randint(0, self.max_play))
+        if kind == "volume":
+            return self.driver.encode_volume(self.random.randint(0, 15))
+        count = self.random.randint(2, 5)
+        return self.driver.encode_sequence(self.random.randint(0, self.max_play) for _ in range(count))
+
+
+class SoakMonitor:
+    """按时间段累计收发统计，并与第一次采样比较判断是否漂移"""
+
+    def __init__(self, metrics_logger, top_allocators=5, rss_growth_mb=50.0, heap_growth_mb=20.0,
+                 latency_drift_ratio=2.0, target_rate=None, rate_shortfall=0.8, min_rate_period=0.0):
+        self.metrics_logger = metrics_logger
+        self.target_rate = target_rate
+        self.rate_shortfall = rate_shortfall
+        # 时间段太短(如结束时最后一段)时发送条数很少, 不检查速率; 至少要能发出一条指令
+        self.min_rate_period = max(min_rate_period, 1.0 / target_rate if target_rate else 0.0)
+        self.top_allocators = top_allocators
+        self.rss_growth = rss_growth_mb * 1024 * 1024
+        self.heap_growth = heap_growth_mb * 1024 * 1024
+        self.latency_drift_ratio = latency_drift_ratio
+        self.baseline = None
+        self.start = time.perf_counter()
+        self.totals = {"commands": 0, "timeouts": 0, "errors": 0, "tx_bytes": 0, "rx_bytes": 0}
+        self.reset_period()
+
+    def reset_period(self):
+        self.period_start = time.perf_counter()
+        self.latencies = []
+        self.period = {"commands": 0, "timeouts": 0, "errors": 0, "tx_bytes": 0, "rx_bytes": 0}
+
+    def add(self, key, value=1):
+        self.period[key] += value
+        self.totals[key] += value
+
+    def add_exchange(self, command, reply, latency):
+        self.add("commands")
+        self.add("tx_bytes", len(command))
+        self.add("rx_bytes", len(reply))
+        if latency is None:
+            self.add("timeouts")
+        else:
+            self.latencies.append(latency * 1000)
+
+    def sample(self):
+        """
+        生成一次采样，写入指标文件并返回。
+        :arg
+            none
+        :returns
+            dict: 采样结果, alerts 中为本次发现的告警
+        :raises
+            none
+        """
+        now = time.perf_counter()
+        period = max(now - self.period_start, 1e-9)
+        latencies = sorted(self.latencies)
+        heap_current, heap_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        sample = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "uptime_s": round(now - self.start, 1),
+            "period_s": round(period, 3),
+            "rss_bytes": current_rss(),
+            "heap_bytes": heap_current,
+            "heap_peak_bytes": heap_peak,
+            "top_allocators": [
+                {"where": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:self.top_allocators]
+            ],
+            "tx_bytes_per_s": round(self.period["tx_bytes"] / period, 1),
+            "rx_bytes_per_s": round(self.period["rx_bytes"] / period, 1),
+            "commands_per_s": round(self.period["commands"] / period, 2),
+            "target_commands_per_s": self.target_rate,
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": round(latencies[-1], 3) if latencies else None,
+            },
+            "period": dict(self.period),
+            "totals": dict(self.totals),
+        }
+        sample["alerts"] = self.check_drift(sample)
+        if self.baseline is None:
+            self.baseline = sample
+        self.metrics_logger.info(json.dumps(sample, ensure_ascii=False))
+        self.reset_period()
+        return sample
+
+    def check_drift(self, sample):
+        alerts = []
+        if sample["period"]["timeouts"]:
+            alerts.append(f"{sample['period']['timeouts']} 条指令无回复")
+        if sample["period"]["errors"]:
+            alerts.append(f"{sample['period']['errors']} 次串口错误")
+        if (self.target_rate and sample["period_s"] >= self.min_rate_period
+                and sample["commands_per_s"] < self.target_rate * self.rate_shortfall):
+            alerts.append(f"实际速率 {sample['commands_per_s']} 条/秒, 低于目标 {self.target_rate} 条/秒"
+                          f"(等待回复或超时占用了发送时间)")
+        base = self.baseline
+        if base is None:
+            return alerts
+        if sample["rss_bytes"] is not None and base["rss_bytes"] is not None:
+            growth = sample["rss_bytes"] - base["rss_bytes"]
+            if growth > self.rss_growth:
+                alerts.append(f"RSS 增长 {growth / 1024 / 1024:.1f} MB")
+        growth = sample["heap_bytes"] - base["heap_bytes"]
+        if growth > self.heap_growth:
+            alerts.append(f"Python 堆增长 {growth / 1024 / 1024:.1f} MB")
+        base_p95, p95 = base["latency_ms"]["p95"], sample["latency_ms"]["p95"]
+        if base_p95 and p95 and p95 > base_p95 * self.latency_drift_ratio:
+            alerts.append(f"p95 延迟 {p95:.2f} ms, 基线 {base_p95:.2f} ms")
+        return alerts
+
+
+def metrics_logger(path, max_bytes, backups):
+    """指标文件按大小滚动, 超过 max_bytes 后改名为 .1/.2 ... 保留 backups 份"""
+    logger = logging.getLogger("soak_metrics")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+def open_port(args):
+    return serial.Serial(args.port, args.baudrate, parity=PARITY_MAP[args.parity], stopbits=STOPBITS_MAP[args.stopbits],
+                         timeout=0, write_timeout=1)
+
+
+def run(args):
+    """
+    执行浸泡测试直到达到时长或被 Ctrl+C 中断。
+    :arg
+        args: 命令行参数
+    :returns
+        int: 出现过告警返回1, 否则返回0
+    :raises
+        ValueError: 脚本文件无效
+    """
+    driver = protocols.get_driver(args.protocol)
+    source = CommandSource(driver, args.script, args.max_play, args.seed)
+    device = None
+    if args.simulate:
+        device = SimulatedDevice()
+        args.port = device.port
+
+    tracemalloc.start()
+    monitor = SoakMonitor(metrics_logger(args.metrics, args.metrics_max_bytes, args.metrics_backups),
+                          args.top, args.rss_growth_mb, args.heap_growth_mb, args.latency_drift,
+                          args.rate, args.rate_shortfall, args.interval / 2)
+    serial_port = open_port(args)
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    next_send = start
+    next_sample = start + args.interval
+    alerted = False
+    try:
+        while args.duration <= 0 or time.perf_counter() - start < args.duration:
+            now = time.perf_counter()
+            if now >= next_sample:
+                sample = monitor.sample()
+                for alert in sample["alerts"]:
+                    alerted = True
+                    print(f"[{sample['time']}] 告警: {alert}", file=sys.stderr)
+                next_sample += args.interval
+            if now < next_send:
+                time.sleep(max(0.0, min(next_send, next_sample) - now))
+                continue
+            # 落后太多时不补发, 避免恢复后瞬间突发大量指令
+            next_send = max(next_send + interval, now)
+            try:
+                if not serial_port.is_open:
+                    serial_port = open_port(args)
+                command = source.next()
+                serial_port.reset_input_buffer()
+                sent_at = time.perf_counter()
+                serial_port.write(command)
+                reply, first_rx = read_reply(serial_port, sent_at, args.reply_timeout, args.idle_gap)
+                monitor.add_exchange(command, reply, None if first_rx is None else first_rx - sent_at)
+            except (serial.SerialException, OSError) as e:
+                monitor.add("errors")
+                print(f"串口错误: {e}", file=sys.stderr)
+                serial_port.close()
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sample = monitor.sample()
+        alerted = alerted or bool(sample["alerts"])
+        serial_port.close()
+        if device is not None:
+            device.close()
+        tracemalloc.stop()
+    print(json.dumps(monitor.totals, ensure_ascii=False))
+    return 1 if alerted else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="长时间浸泡测试, 记录内存、速率和延迟漂移")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--port", help="设备串口")
+    target.add_argument("--simulate", action="store_true", help="使用 pty 模拟设备(仅 Linux/macOS)")
+    target.add_argument("--serve-simulator", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--baudrate", type=int, default=1000000)
+    parser.add_argument("--parity", choices=list(PARITY_MAP), default="None")
+    parser.add_argument("--stopbits", choices=list(STOPBITS_MAP), default="1")
+    parser.add_argument("--protocol", choices=list(protocols.available_drivers()), default=protocols.DEFAULT_DRIVER)
+    parser.add_argument("--script", help="指令脚本文件, 不指定时随机生成指令")
+    parser.add_argument("--max-play", type=int, default=100, help="随机播放的最大语音编号")
+    parser.add_argument("--seed", type=int, help="随机种子, 便于复现")
+    parser.add_argument("--rate", type=float, default=10.0, help="目标发送速率(条/秒)")
+    parser.add_argument("--duration", type=float, default=3600, help="运行时长(秒), 0 表示一直运行")
+    parser.add_argument("--reply-timeout", type=float, default=0.5, help="每条指令等待回复的秒数")
+    parser.add_argument("--idle-gap", type=float, default=0.02, help="判定回复结束的空闲间隔(秒)")
+    parser.add_argument("--interval", type=float, default=60, help="采样间隔(秒)")
+    parser.add_argument("--metrics", default="soak_metrics.jsonl", help="指标文件路径")
+    parser.add_argument("--metrics-max-bytes", type=int, default=10 * 1024 * 1024, help="指标文件滚动大小")
+    parser.add_argument("--metrics-backups", type=int, default=5, help="保留的历史指标文件数")
+    parser.add_argument("--top", type=int, default=5, help="记录分配内存最多的代码位置数")
+    parser.add_argument("--rss-growth-mb", type=float, default=50.0, help="RSS 增长告警阈值(MB)")
+    parser.add_argument("--heap-growth-mb", type=float, default=20.0, help="Python 堆增长告警阈值(MB)")
+    parser.add_argument("--latency-drift", type=float, default=2.0, help="p95 延迟相对基线的告警倍数")
+    parser.add_argument("--rate-shortfall", type=float, default=0.8, help="实际速率低于目标速率的该比例时告警")
+    args = parser.parse_args(argv)
+    if args.serve_simulator:
+        serve_simulator()
+        return 0
+    if args.rate <= 0:
+        parser.error("--rate 必须大于0")
+    try:
+        return run(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+bulk_send 的hex文本解析测试: 按块流式解析文件与 parse_hex_text 解析整段文本的结果必须一致。
+运行: python -m unittest test_bulk_send
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import bulk_send
+
+SAMPLES = [
+    "FF F3 00 01",
+    "0xFF,0xF3,0x00,0x01\n",
+    "FFF30001",
+    "FFF30001\r\n",
+    "5 0x5 A0",
+    "ABC",
+    "FFF3000",
+    "FFF3000\n",
+    "ABCDE F0",
+    "0x5",
+    "AB 0xC",
+    "AB0xCD",
+    "12 34 5G",
+    "",
+]
+
+
+class HexFileParseTest(unittest.TestCase):
+
+    def parse_file(self, text, block_size):
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        try:
+            with os.fdopen(fd, "w", encoding="ascii", newline="") as f:
+                f.write(text)
+            sender = bulk_send.BulkSender(None, hex_path=path)
+            with mock.patch.object(bulk_send, "HEX_BLOCK_SIZE", block_size):
+                return sender._parse_hex_file()
+        finally:
+            os.remove(path)
+
+    def parse_text(self, text):
+        return bulk_send.parse_hex_text(text)
+
+    def assert_same_result(self, text):
+        try:
+            expected = self.parse_text(text)
+        except ValueError:
+            expected = ValueError
+        for block_size in range(1, len(text) + 2):
+            with self.subTest(text=text, block_size=block_size):
+                if expected is ValueError:
+                    with self.assertRaises(ValueError):
+                        self.parse_file(text, block_size)
+                else:
+                    self.assertEqual(bytes(self.parse_file(text, block_size)), expected)
+
+    def test_file_matches_text(self):
+        for text in SAMPLES:
+            self.assert_same_result(text)
+
+    def test_odd_continuous_leftover_rejected(self):
+        for text in ("ABC", "FFF3000"):
+            with self.assertRaisesRegex(ValueError, "hex串长度为奇数"):
+                self.parse_file(text, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()